@@ -1,146 +1,215 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
+from flask import Flask, Blueprint, Request, current_app, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import sqlite3
 import os
+import secrets
+import threading
+import time
+import click
 from datetime import datetime
+from functools import wraps
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'
+import db
+import filetypes
+import previews
+import reconcile
+import storage
+from ratelimit import rate_limit
+
+bp = Blueprint('main', __name__)
 
 # File upload configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'ppt', 'pptx', 'jpg', 'jpeg', 'png', 'txt', 'zip'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Create upload folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class UploadRequest(Request):
+    """Streams the file of a resource upload straight into the uploads folder.
+
+    The file is validated by content while the request body is parsed (see
+    filetypes.py), so a bad upload is rejected without reading the rest of the
+    body, and a good one is never spooled to a temp file and copied.
+    """
+    upload = None
+    upload_name = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'main.upload_resource' or not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if self.upload is not None:
+            raise filetypes.UploadRejected('Please upload one file at a time!')
+        
+        # Secure the filename and add timestamp; the random part keeps two uploads
+        # of the same name in the same second apart
+        original_filename = secure_filename(filename)
+        if not allowed_file(original_filename):
+            raise filetypes.UploadRejected('Invalid file type! Allowed types: PDF, DOCX, PPT, Images, TXT, ZIP')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        stored_name = f"{timestamp}_{secrets.token_hex(4)}_{original_filename}"
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], stored_name)
+        extension = original_filename.rsplit('.', 1)[1].lower()
+        compression = current_app.config['UPLOAD_COMPRESSION'] if extension in storage.COMPRESSIBLE_EXTENSIONS else ''
+        self.upload = filetypes.UploadWriter(path, extension, compression)
+        self.upload_name = original_filename
+        return self.upload
+
+    def close(self):
+        # Removes the partial file if the upload was not accepted
+        if self.upload is not None:
+            self.upload.close()
+        super().close()
+
+# Token bucket limits per route: (burst capacity, seconds to refill it).
+# Each logged-in user gets its own bucket; anonymous clients one per IP.
+RATE_LIMITS = {
+    'login': (10, 60),
+    'download': (30, 60),
+    'access_resources': (20, 60),
+    'facets': (60, 60),
+    'catalog_changes': (60, 60),
+    'resource_detail': (60, 60),
+    'preview': (180, 60),
+    'upload': (10, 300),
+    'review': (20, 300),
+    'admin': (30, 60),
+}
+
 # configure a simple admin email (change via env if desired)
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
 
-# Database setup
-def init_db():
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            college TEXT NOT NULL,
-            branch TEXT NOT NULL,
-            semester TEXT NOT NULL
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS resources (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            subject TEXT NOT NULL,
-            semester TEXT NOT NULL,
-            resource_type TEXT NOT NULL,
-            year_batch TEXT NOT NULL,
-            description TEXT,
-            tags TEXT,
-            filename TEXT NOT NULL,
-            original_filename TEXT NOT NULL,
-            file_size INTEGER,
-            privacy TEXT DEFAULT 'Public',
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Add privacy column if it doesn't exist (for existing databases)
-    try:
-        cursor.execute("ALTER TABLE resources ADD COLUMN privacy TEXT DEFAULT 'Public'")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    # Create reviews table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            resource_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
-            review_text TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (resource_id) REFERENCES resources (id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(resource_id, user_id)
-        )
-    ''')
-    
-    # Create download history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS download_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            resource_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            download_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (resource_id) REFERENCES resources (id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    conn = sqlite3.connect('users.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_resource_rating(resource_id):
-    """Get average rating and review count for a resource"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT 
-            COALESCE(AVG(rating), 0) as avg_rating,
-            COUNT(*) as review_count
-        FROM reviews
-        WHERE resource_id = ?
-    ''', (resource_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return {
-        'avg_rating': round(result['avg_rating'], 1) if result['avg_rating'] else 0,
-        'review_count': result['review_count']
-    }
-
-def get_user_review(resource_id, user_id):
-    """Get user's review for a specific resource"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM reviews
-        WHERE resource_id = ? AND user_id = ?
-    ''', (resource_id, user_id))
-    review = cursor.fetchone()
-    conn.close()
-    return dict(review) if review else None
-
-# Initialize database
-init_db()
-
-@app.route('/')
+def add_rating_info(conn, resources, key='id'):
+    """Attach avg_rating/review_count to each resource dict"""
+    ratings = db.get_resource_ratings(conn, [resource[key] for resource in resources])
+    for resource in resources:
+        rating_info = ratings.get(resource[key], {'avg_rating': 0, 'review_count': 0})
+        resource['avg_rating'] = rating_info['avg_rating']
+        resource['review_count'] = rating_info['review_count']
+    return resources
+
+def is_accessible(resource, user):
+    """Public resources are open to everyone, private ones to the uploader's college"""
+    if resource['privacy'] == 'Public':
+        return True
+    return resource['privacy'] == 'Private' and resource['uploader_college'] == user['college']
+
+# Read-only pages use read-only connections (a replica on server databases),
+# except for a short window after the user's own write so they always see it.
+READ_YOUR_WRITES_WINDOW = 10  # seconds
+
+def mark_write():
+    """Remember that the current user just changed something"""
+    session['last_write'] = time.time()
+
+def read_connection():
+    """Connection for a read-only route, honouring read-your-writes"""
+    recent_write = time.time() - session.get('last_write', 0) < READ_YOUR_WRITES_WINDOW
+    return db.connect(readonly=not recent_write)
+
+# Per-user counters for dashboard/profile/history, cached per process. An entry
+# is only reused if it was computed after the user's last write, so their own
+# activity invalidates it on every worker.
+USER_STATS_TTL = 60  # seconds
+USER_STATS_CACHE_SIZE = 10000
+_user_stats_cache = {}
+
+def get_user_stats(conn, user_id):
+    """Get upload/review/download counts for a user, from cache when fresh"""
+    now = time.time()
+    cached = _user_stats_cache.get(user_id)
+    if cached and now - cached[0] < USER_STATS_TTL and cached[0] > session.get('last_write', 0):
+        return cached[1]
+    
+    stats = db.get_user_stats(conn, user_id)
+    if len(_user_stats_cache) >= USER_STATS_CACHE_SIZE:
+        _user_stats_cache.clear()
+    _user_stats_cache[user_id] = (now, stats)
+    return stats
+
+FACET_CACHE_TTL = 60  # seconds
+FACET_CACHE_SIZE = 512
+
+# GROUP BY results keyed by (catalog version, college, filters)
+_facet_cache = {}
+_catalog_version = 0
+
+def invalidate_catalog_cache():
+    """Drop cached catalog aggregates after a resource is added, edited or removed"""
+    global _catalog_version
+    _catalog_version += 1
+    _facet_cache.clear()
+
+def get_resource_facets(conn, args, college):
+    """Get per-facet counts for the catalog under the given filters"""
+    filters = db.build_resource_filters(args, college)
+    key = (_catalog_version, college,
+           tuple(sorted((name, tuple(params)) for name, (_, params) in filters.items())))
+    cached = _facet_cache.get(key)
+    if cached and time.monotonic() - cached[0] < FACET_CACHE_TTL:
+        return cached[1]
+    
+    result = db.count_resource_facets(conn, filters, college)
+    if len(_facet_cache) >= FACET_CACHE_SIZE:
+        _facet_cache.clear()
+    _facet_cache[key] = (time.monotonic(), result)
+    return result
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    This never touches the database or creates folders, so it is cheap to call
+    on every worker boot and safe in a gunicorn --preload master (no SQLite
+    handle is opened before the fork). Run `flask --app app init-db` once per
+    deploy to create and migrate the schema.
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') != '0'
+    app.config['RATE_LIMITS'] = dict(RATE_LIMITS)
+    app.config['UPLOAD_COMPRESSION'] = storage.UPLOAD_COMPRESSION
+    # Number of reverse proxies (nginx, a load balancer) in front of the app.
+    # Their X-Forwarded-For is trusted so rate limits see the client's IP
+    # rather than the proxy's; leave at 0 when clients connect directly.
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', '0'))
+    if config:
+        app.config.update(config)
+    if app.config['UPLOAD_COMPRESSION'] not in storage.ENCODINGS:
+        raise ValueError(f"Unsupported UPLOAD_COMPRESSION: {app.config['UPLOAD_COMPRESSION']}")
+    if app.config['TRUSTED_PROXIES']:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+    
+    app.register_blueprint(bp)
+    for command in (init_db_command, archive_downloads_command, compact_downloads_command,
+                    reconcile_uploads_command):
+        app.cli.add_command(command)
+    
+    preload_templates(app)
+    return app
+
+def preload_templates(app):
+    """Compile every template up front instead of on the first hit to each page"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+def init_storage():
+    """One-time setup: create folders and create/migrate the database schema"""
+    if not os.path.exists(UPLOAD_FOLDER):
+        os.makedirs(UPLOAD_FOLDER)
+    os.makedirs(previews.PREVIEW_FOLDER, exist_ok=True)
+    db.init_db()
+
+@bp.route('/')
 def home():
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
 
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -151,42 +220,30 @@ def signup():
         branch = request.form.get('branch')
         semester = request.form.get('semester')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if email already exists
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        if cursor.fetchone():
-            conn.close()
-            flash('Email already exists!', 'error')
-            return redirect(url_for('signup'))
-        
-        # Insert new user
-        hashed_password = generate_password_hash(password)
-        cursor.execute('''
-            INSERT INTO users (name, email, password, phone, college, branch, semester)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (name, email, hashed_password, phone, college, branch, semester))
-        
-        conn.commit()
-        conn.close()
+        with db.connect() as conn:
+            # Check if email already exists
+            if db.get_user_by_email(conn, email):
+                flash('Email already exists!', 'error')
+                return redirect(url_for('.signup'))
+            
+            # Insert new user
+            hashed_password = generate_password_hash(password)
+            db.create_user(conn, name, email, hashed_password, phone, college, branch, semester)
         
         flash('Registration successful! Please login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('signup.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login')
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        conn.close()
+        with db.connect() as conn:
+            user = db.get_user_by_email(conn, email)
         
         if user and check_password_hash(user['password'], password):
             session['user'] = email
@@ -195,40 +252,26 @@ def login():
             # simple role: treat ADMIN_EMAIL as admin
             session['user_type'] = 'admin' if email == ADMIN_EMAIL else 'student'
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         else:
             flash('Invalid email or password!', 'error')
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
     
     return render_template('login.html')
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
-    # Get user's uploaded resources
-    cursor.execute('''
-        SELECT * FROM resources 
-        WHERE user_id = ? 
-        ORDER BY upload_date DESC
-    ''', (user['id'],))
-    resources = [dict(row) for row in cursor.fetchall()]
-    
-    # Get download count
-    cursor.execute('SELECT COUNT(*) as count FROM download_history WHERE user_id = ?', (user['id'],))
-    download_count = cursor.fetchone()['count']
-    
-    conn.close()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # Get upload and download counts
+        stats = get_user_stats(conn, user['id'])
     
     user_data = {
         'name': user['name'],
@@ -236,342 +279,245 @@ def dashboard():
         'college': user['college'],
         'branch': user['branch'],
         'semester': user['semester'],
-        'download_count': download_count
+        'upload_count': stats['upload_count'],
+        'download_count': stats['download_count']
     }
     
-    return render_template('dashboard.html', user=user_data, resources=resources)
+    return render_template('dashboard.html', user=user_data)
 
-@app.route('/upload_page')
+@bp.route('/upload_page')
 def upload_page():
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
-    
-    # Get user's uploaded resources
-    cursor.execute('''
-        SELECT * FROM resources 
-        WHERE user_id = ? 
-        ORDER BY upload_date DESC
-    ''', (user['id'],))
-    resources = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # Get user's uploaded resources
+        resources = db.list_user_resources(conn, user['id'])
     
     return render_template('upload_page.html', resources=resources)
 
-@app.route('/upload_resource', methods=['POST'])
+@bp.route('/upload_resource', methods=['POST'])
+@rate_limit('upload')
 def upload_resource():
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
+    
+    # Parsing the form streams the file to disk and checks its content
+    try:
+        form = request.form
+        file = request.files.get('file')
+        mime_type = file.stream.finish() if file and request.upload else None
+    except filetypes.UploadRejected as e:
+        flash(str(e), 'error')
+        response = redirect(url_for('.dashboard'))
+        # The rest of the body was not read, so the connection can't be reused
+        response.headers['Connection'] = 'close'
+        return response
     
     # Get form data
-    title = request.form.get('title')
-    subject = request.form.get('subject')
-    semester = request.form.get('semester')
-    resource_type = request.form.get('resource_type')
-    year_batch = request.form.get('year_batch')
-    description = request.form.get('description', '')
-    tags = request.form.get('tags', '')
-    privacy = request.form.get('privacy', 'Public')
+    title = form.get('title')
+    subject = form.get('subject')
+    semester = form.get('semester')
+    resource_type = form.get('resource_type')
+    year_batch = form.get('year_batch')
+    description = form.get('description', '')
+    tags = form.get('tags', '')
+    privacy = form.get('privacy', 'Public')
     
     # Check if file is present
-    if 'file' not in request.files:
+    if not mime_type:
         flash('No file selected!', 'error')
-        return redirect(url_for('dashboard'))
-    
-    file = request.files['file']
+        return redirect(url_for('.dashboard'))
     
-    if file.filename == '':
-        flash('No file selected!', 'error')
-        return redirect(url_for('dashboard'))
+    upload = request.upload
+    filename = os.path.basename(upload.path)
     
-    if file and allowed_file(file.filename):
-        # Secure the filename and add timestamp
-        original_filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # Save file
-        file.save(filepath)
-        file_size = os.path.getsize(filepath)
-        
-        # Get user ID
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-        user = cursor.fetchone()
+    with db.connect() as conn:
+        user = db.get_user_by_email(conn, session['user'])
         
         # Insert resource into database
-        cursor.execute('''
-            INSERT INTO resources 
-            (user_id, title, subject, semester, resource_type, year_batch, description, tags, filename, original_filename, file_size, privacy)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user['id'], title, subject, semester, resource_type, year_batch, description, tags, filename, original_filename, file_size, privacy))
-        
-        conn.commit()
-        conn.close()
-        
-        flash('Resource uploaded successfully!', 'success')
-    else:
-        flash('Invalid file type! Allowed types: PDF, DOCX, PPT, Images, TXT, ZIP', 'error')
+        db.create_resource(conn, user['id'], title, subject, semester, resource_type, year_batch,
+                           description, tags, filename, request.upload_name, upload.size, privacy,
+                           upload.sha256, mime_type, upload.content_encoding, upload.stored_size)
+    invalidate_catalog_cache()
+    mark_write()
     
-    return redirect(url_for('dashboard'))
+    flash('Resource uploaded successfully!', 'success')
+    return redirect(url_for('.dashboard'))
 
-@app.route('/edit_resource/<int:resource_id>', methods=['POST'])
+@bp.route('/edit_resource/<int:resource_id>', methods=['POST'])
 def edit_resource(resource_id):
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get user ID
-    cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    # Check if resource belongs to user
-    cursor.execute('SELECT * FROM resources WHERE id = ? AND user_id = ?', (resource_id, user['id']))
-    resource = cursor.fetchone()
-    
-    if not resource:
-        flash('Resource not found or unauthorized!', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
-    
-    # Update resource
-    title = request.form.get('title')
-    subject = request.form.get('subject')
-    semester = request.form.get('semester')
-    resource_type = request.form.get('resource_type')
-    year_batch = request.form.get('year_batch')
-    description = request.form.get('description', '')
-    tags = request.form.get('tags', '')
-    privacy = request.form.get('privacy', 'Public')
-    
-    cursor.execute('''
-        UPDATE resources 
-        SET title = ?, subject = ?, semester = ?, resource_type = ?, year_batch = ?, description = ?, tags = ?, privacy = ?
-        WHERE id = ?
-    ''', (title, subject, semester, resource_type, year_batch, description, tags, privacy, resource_id))
-    
-    conn.commit()
-    conn.close()
+        return redirect(url_for('.login'))
+    
+    with db.connect() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        # Check if resource belongs to user
+        resource = db.get_owned_resource(conn, resource_id, user['id'])
+        
+        if not resource:
+            flash('Resource not found or unauthorized!', 'error')
+            return redirect(url_for('.dashboard'))
+        
+        # Update resource
+        title = request.form.get('title')
+        subject = request.form.get('subject')
+        semester = request.form.get('semester')
+        resource_type = request.form.get('resource_type')
+        year_batch = request.form.get('year_batch')
+        description = request.form.get('description', '')
+        tags = request.form.get('tags', '')
+        privacy = request.form.get('privacy', 'Public')
+        
+        db.update_resource(conn, resource_id, title, subject, semester, resource_type, year_batch,
+                           description, tags, privacy)
+    invalidate_catalog_cache()
+    mark_write()
     
     flash('Resource updated successfully!', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('.dashboard'))
 
-@app.route('/delete_resource/<int:resource_id>')
+@bp.route('/delete_resource/<int:resource_id>')
 def delete_resource(resource_id):
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get user ID
-    cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    # Check if resource belongs to user
-    cursor.execute('SELECT * FROM resources WHERE id = ? AND user_id = ?', (resource_id, user['id']))
-    resource = cursor.fetchone()
+        return redirect(url_for('.login'))
     
-    if not resource:
-        flash('Resource not found or unauthorized!', 'error')
-        conn.close()
-        return redirect(url_for('dashboard'))
-    
-    # Delete file from filesystem
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], resource['filename'])
-    if os.path.exists(filepath):
-        os.remove(filepath)
-    
-    # Delete from database
-    cursor.execute('DELETE FROM resources WHERE id = ?', (resource_id,))
-    conn.commit()
-    conn.close()
+    with db.connect() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        # Check if resource belongs to user
+        resource = db.get_owned_resource(conn, resource_id, user['id'])
+        
+        if not resource:
+            flash('Resource not found or unauthorized!', 'error')
+            return redirect(url_for('.dashboard'))
+        
+        # Delete file from filesystem
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], resource['filename'])
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        
+        # Delete from database
+        db.delete_resource(conn, resource_id)
+    invalidate_catalog_cache()
+    mark_write()
     
     flash('Resource deleted successfully!', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('.dashboard'))
 
-@app.route('/download/<int:resource_id>')
+@bp.route('/download/<int:resource_id>')
+@rate_limit('download')
 def download_resource(resource_id):
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get current user info
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    current_user = cursor.fetchone()
-    
-    # Get resource with uploader info
-    cursor.execute('''
-        SELECT r.*, u.college as uploader_college 
-        FROM resources r
-        JOIN users u ON r.user_id = u.id
-        WHERE r.id = ?
-    ''', (resource_id,))
-    resource = cursor.fetchone()
-    
-    if not resource:
-        conn.close()
-        flash('Resource not found!', 'error')
-        return redirect(url_for('dashboard'))
-    
-    # Check privacy access
-    if resource['privacy'] == 'Private':
-        if current_user['college'] != resource['uploader_college']:
-            conn.close()
-            flash('Access denied! This resource is private and only available to students from ' + resource['uploader_college'], 'error')
-            return redirect(url_for('access_resources'))
-    
-    # Record download in history
-    try:
-        cursor.execute('''
-            INSERT INTO download_history (resource_id, user_id)
-            VALUES (?, ?)
-        ''', (resource_id, current_user['id']))
-        conn.commit()
-    except Exception as e:
-        print(f"Error recording download: {e}")
-    
-    conn.close()
+        return redirect(url_for('.login'))
     
-    return send_from_directory(app.config['UPLOAD_FOLDER'], resource['filename'], as_attachment=True, download_name=resource['original_filename'])
-
-
-@app.route('/my_resources')
+    with db.connect() as conn:
+        # Get current user info
+        current_user = db.get_user_by_email(conn, session['user'])
+        
+        # Get resource with uploader info
+        resource = db.get_resource_with_uploader(conn, resource_id)
+        
+        if not resource:
+            flash('Resource not found!', 'error')
+            return redirect(url_for('.dashboard'))
+        
+        # Check privacy access
+        if resource['privacy'] == 'Private':
+            if current_user['college'] != resource['uploader_college']:
+                flash('Access denied! This resource is private and only available to students from ' + resource['uploader_college'], 'error')
+                return redirect(url_for('.access_resources'))
+        
+        # Record download in history
+        try:
+            db.record_download(conn, resource_id, current_user['id'])
+            mark_write()
+        except Exception as e:
+            print(f"Error recording download: {e}")
+    
+    encoding = resource['content_encoding']
+    if encoding and not request.accept_encodings[encoding]:
+        # Stored compressed but the client can't take it: decompress while sending
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], resource['filename'])
+        response = send_file(storage.open_stored(filepath, encoding), as_attachment=True, download_name=resource['original_filename'])
+        response.content_length = resource['file_size']
+    else:
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], resource['filename'], as_attachment=True, download_name=resource['original_filename'])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    if encoding:
+        response.vary.add('Accept-Encoding')
+    if resource['mime_type']:
+        # Detected from the content at upload time
+        response.content_type = resource['mime_type']
+    return response
+
+
+@bp.route('/my_resources')
 def my_resources():
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
+        return redirect(url_for('.login'))
     
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
-    
-    # Get user's uploaded resources with ratings
-    cursor.execute('''
-        SELECT * FROM resources 
-        WHERE user_id = ? 
-        ORDER BY upload_date DESC
-    ''', (user['id'],))
-    resources = []
-    for row in cursor.fetchall():
-        resource_dict = dict(row)
-        rating_info = get_resource_rating(row['id'])
-        resource_dict['avg_rating'] = rating_info['avg_rating']
-        resource_dict['review_count'] = rating_info['review_count']
-        resources.append(resource_dict)
-    
-    conn.close()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # Get user's uploaded resources with ratings
+        resources = add_rating_info(conn, db.list_user_resources(conn, user['id']))
     
     return render_template('my_resources.html', resources=resources, user=user)
 
 
-@app.route('/download_history')
+DOWNLOADS_PER_PAGE = 50
+
+@bp.route('/download_history')
 def download_history():
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
+        return redirect(url_for('.login'))
     
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
-    
-    # Get download history with resource details
-    cursor.execute('''
-        SELECT 
-            dh.id,
-            dh.download_date,
-            r.id as resource_id,
-            r.title,
-            r.subject,
-            r.resource_type,
-            r.semester,
-            r.year_batch,
-            r.privacy,
-            u.name as uploader_name,
-            u.college as uploader_college
-        FROM download_history dh
-        JOIN resources r ON dh.resource_id = r.id
-        JOIN users u ON r.user_id = u.id
-        WHERE dh.user_id = ?
-        ORDER BY dh.download_date DESC
-    ''', (user['id'],))
-    
-    downloads = [dict(row) for row in cursor.fetchall()]
-    
-    # Add rating info for each resource
-    for download in downloads:
-        rating_info = get_resource_rating(download['resource_id'])
-        download['avg_rating'] = rating_info['avg_rating']
-        download['review_count'] = rating_info['review_count']
-    
-    # Get statistics
-    cursor.execute('SELECT COUNT(*) as count FROM download_history WHERE user_id = ?', (user['id'],))
-    total_downloads = cursor.fetchone()['count']
-    
-    cursor.execute('''
-        SELECT COUNT(DISTINCT resource_id) as count 
-        FROM download_history 
-        WHERE user_id = ?
-    ''', (user['id'],))
-    unique_resources = cursor.fetchone()['count']
-    
-    conn.close()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # One page of download history; older months are read only when paged to
+        downloads, next_cursor = db.get_user_downloads(conn, user['id'], DOWNLOADS_PER_PAGE, request.args.get('before'))
+        downloads = add_rating_info(conn, downloads, key='resource_id')
+        
+        # Get statistics
+        user_stats = get_user_stats(conn, user['id'])
     
     stats = {
-        'total_downloads': total_downloads,
-        'unique_resources': unique_resources
+        'total_downloads': user_stats['download_count'],
+        'unique_resources': user_stats['unique_downloads']
     }
     
-    return render_template('download_history.html', user=user, downloads=downloads, stats=stats)
+    return render_template('download_history.html', user=user, downloads=downloads, stats=stats,
+                         next_cursor=next_cursor, first_page=not request.args.get('before'))
 
 
-@app.route('/my_profile')
+@bp.route('/my_profile')
 def my_profile():
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
-    # Get user statistics
-    cursor.execute('SELECT COUNT(*) as count FROM resources WHERE user_id = ?', (user['id'],))
-    upload_count = cursor.fetchone()['count']
-    
-    cursor.execute('SELECT COUNT(*) as count FROM reviews WHERE user_id = ?', (user['id'],))
-    review_count = cursor.fetchone()['count']
-    
-    cursor.execute('SELECT COUNT(*) as count FROM download_history WHERE user_id = ?', (user['id'],))
-    download_count = cursor.fetchone()['count']
-    
-    conn.close()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # Get user statistics
+        stats = get_user_stats(conn, user['id'])
     
     user_data = {
         'name': user['name'],
@@ -580,59 +526,43 @@ def my_profile():
         'college': user['college'],
         'branch': user['branch'],
         'semester': user['semester'],
-        'upload_count': upload_count,
-        'review_count': review_count,
-        'download_count': download_count
+        'upload_count': stats['upload_count'],
+        'review_count': stats['review_count'],
+        'download_count': stats['download_count']
     }
     
     return render_template('my_profile.html', user=user_data)
 
 
-@app.route('/access_resources')
+@bp.route('/access_resources')
+@rate_limit('access_resources')
 def access_resources():
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get current user info
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    if not user:
-        conn.close()
-        return redirect(url_for('login'))
-    
-    # Get sort parameter from request
-    sort = request.args.get('sort', 'latest')
-    
-    # Get all resources with uploader info
-    cursor.execute('''
-        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch
-        FROM resources r
-        JOIN users u ON r.user_id = u.id
-    ''')
-    all_resources = cursor.fetchall()
-    conn.close()
-    
-    # Filter resources based on privacy
-    accessible_resources = []
-    for resource in all_resources:
-        resource_dict = dict(resource)
-        if resource['privacy'] == 'Public':
-            resource_dict['accessible'] = True
-        elif resource['privacy'] == 'Private' and resource['uploader_college'] == user['college']:
-            resource_dict['accessible'] = True
-        else:
-            resource_dict['accessible'] = False
+    with read_connection() as conn:
+        # Get current user info
+        user = db.get_user_by_email(conn, session['user'])
         
-        # Add rating information
-        rating_info = get_resource_rating(resource['id'])
-        resource_dict['avg_rating'] = rating_info['avg_rating']
-        resource_dict['review_count'] = rating_info['review_count']
+        if not user:
+            return redirect(url_for('.login'))
+        
+        # Get sort parameter from request
+        sort = request.args.get('sort', 'latest')
+        
+        # Browsers keeping the catalog in IndexedDB only need the page shell;
+        # they fetch what changed from /api/resources/changes themselves
+        client_cache = request.cookies.get('catalog_cache') == '1'
         
-        accessible_resources.append(resource_dict)
+        # Get all resources with uploader info and ratings
+        if client_cache:
+            accessible_resources = []
+        else:
+            accessible_resources = add_rating_info(conn, db.list_catalog(conn))
+    
+    # Mark resources the user can open based on privacy
+    for resource in accessible_resources:
+        resource['accessible'] = is_accessible(resource, user)
     
     # Sorting
     if sort == "latest":
@@ -657,173 +587,226 @@ def access_resources():
         accessible_resources.sort(key=lambda x: x['upload_date'], reverse=True)
     
     user_data = {
+        'id': user['id'],
         'name': user['name'],
         'college': user['college'],
         'branch': user['branch'],
         'semester': user['semester']
     }
     
-    return render_template('access_resources.html', user=user_data, resources=accessible_resources)
+    return render_template('access_resources.html', user=user_data, resources=accessible_resources,
+                           client_cache=client_cache)
 
 
-@app.route('/resource/<int:resource_id>')
-def resource_detail(resource_id):
+# Fields the access_resources cards need; everything else stays server-side
+CATALOG_SYNC_FIELDS = ('id', 'title', 'subject', 'semester', 'resource_type', 'year_batch', 'description',
+                       'tags', 'privacy', 'upload_date', 'uploader_name', 'uploader_college', 'uploader_branch')
+
+@bp.route('/api/resources/changes')
+@rate_limit('catalog_changes')
+def catalog_changes():
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    since = request.args.get('since', 0, type=int)
     
-    # Get current user info
-    cursor.execute('SELECT * FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return jsonify({'success': False, 'message': 'Student not found'}), 404
+        
+        seq, full, changed, deleted = db.get_catalog_changes(conn, since)
+        changed = add_rating_info(conn, changed)
     
-    # Get resource with uploader info
-    cursor.execute('''
-        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch
-        FROM resources r
-        JOIN users u ON r.user_id = u.id
-        WHERE r.id = ?
-    ''', (resource_id,))
-    resource = cursor.fetchone()
+    resources = []
+    for resource in changed:
+        item = {field: resource[field] for field in CATALOG_SYNC_FIELDS}
+        item['upload_date'] = str(item['upload_date'])
+        item['avg_rating'] = resource['avg_rating']
+        item['review_count'] = resource['review_count']
+        item['accessible'] = is_accessible(resource, user)
+        resources.append(item)
     
-    if not resource:
-        conn.close()
-        flash('Resource not found!', 'error')
-        return redirect(url_for('access_resources'))
+    return jsonify({
+        'success': True,
+        'seq': seq,
+        'full': full,
+        'resources': resources,
+        'deleted': deleted
+    })
+
+
+@bp.route('/api/facets')
+@rate_limit('facets')
+def resource_facets():
+    if 'user' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not user:
+            return jsonify({'success': False, 'message': 'Student not found'}), 404
+        
+        result = get_resource_facets(conn, request.args, user['college'])
     
-    resource_dict = dict(resource)
+    return jsonify({'success': True, 'total': result['total'], 'facets': result['facets']})
+
+
+REVIEWS_PER_PAGE = 20
+
+@bp.route('/resource/<int:resource_id>')
+@rate_limit('resource_detail')
+def resource_detail(resource_id):
+    if 'user' not in session:
+        return redirect(url_for('.login'))
     
-    # Check accessibility
-    if resource['privacy'] == 'Public':
-        resource_dict['accessible'] = True
-    elif resource['privacy'] == 'Private' and resource['uploader_college'] == user['college']:
-        resource_dict['accessible'] = True
-    else:
-        resource_dict['accessible'] = False
-    
-    # Get rating information
-    rating_info = get_resource_rating(resource_id)
-    resource_dict['avg_rating'] = rating_info['avg_rating']
-    resource_dict['review_count'] = rating_info['review_count']
-    
-    # Get all reviews with user info
-    cursor.execute('''
-        SELECT r.*, u.name as reviewer_name
-        FROM reviews r
-        JOIN users u ON r.user_id = u.id
-        WHERE r.resource_id = ?
-        ORDER BY r.created_at DESC
-    ''', (resource_id,))
-    reviews = [dict(row) for row in cursor.fetchall()]
-    
-    # Get current user's review if exists
-    user_review = get_user_review(resource_id, user['id'])
-    
-    conn.close()
-    
-    return render_template('resource_detail.html', 
-                         resource=resource_dict, 
-                         reviews=reviews, 
+    with read_connection() as conn:
+        # Get current user info
+        user = db.get_user_by_email(conn, session['user'])
+        
+        # Get resource with uploader info
+        resource_dict = db.get_resource_with_uploader(conn, resource_id)
+        
+        if not resource_dict:
+            flash('Resource not found!', 'error')
+            return redirect(url_for('.access_resources'))
+        
+        # Check accessibility
+        resource_dict['accessible'] = is_accessible(resource_dict, user)
+        resource_dict['preview_pages'] = previews.preview_pages(resource_dict['filename']) if resource_dict['accessible'] else 0
+        
+        # Get rating information
+        rating_info = db.get_resource_rating(conn, resource_id)
+        resource_dict['avg_rating'] = rating_info['avg_rating']
+        resource_dict['review_count'] = rating_info['review_count']
+        resource_dict['rating_histogram'] = rating_info['histogram']
+        
+        # One page of reviews; older ones are reached through the cursor
+        reviews, next_cursor, user_review = [], None, None
+        if resource_dict['accessible']:
+            reviews, next_cursor = db.list_reviews(conn, resource_id, REVIEWS_PER_PAGE, request.args.get('reviews'))
+            
+            # Get current user's review if exists
+            user_review = db.get_user_review(conn, resource_id, user['id'])
+    
+    return render_template('resource_detail.html',
+                         resource=resource_dict,
+                         reviews=reviews,
+                         next_cursor=next_cursor,
+                         first_page=not request.args.get('reviews'),
                          user_review=user_review,
                          user=user)
 
 
-@app.route('/submit_review/<int:resource_id>', methods=['POST'])
+# Thumbnails never change for a given file, so browsers may keep them for a year
+PREVIEW_MAX_AGE = 365 * 24 * 3600
+
+@bp.route('/preview/<int:resource_id>/<int:page>.webp')
+@rate_limit('preview')
+def resource_preview(resource_id, page):
+    if 'user' not in session:
+        return redirect(url_for('.login'))
+    
+    with read_connection() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        resource = db.get_resource_with_uploader(conn, resource_id)
+    
+    if not resource or not is_accessible(resource, user) or not 1 <= page <= previews.preview_pages(resource['filename']):
+        return 'Preview not available', 404
+    
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], resource['filename'])
+    if not os.path.exists(filepath):
+        return 'Preview not available', 404
+    
+    file_hash = resource['file_hash']
+    if not file_hash:
+        # Uploaded before hashes were recorded; hash once and remember it
+        file_hash = previews.file_sha256(filepath)
+        with db.connect() as conn:
+            db.set_file_hash(conn, resource_id, file_hash)
+    
+    thumbnail = previews.get_preview(filepath, file_hash, page, resource['content_encoding'])
+    if not thumbnail:
+        return 'Preview not available', 404
+    
+    response = send_file(thumbnail, mimetype='image/webp', etag=f'{file_hash}-{page}', max_age=PREVIEW_MAX_AGE)
+    # Access depends on the viewer, so only the browser may cache it
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.route('/submit_review/<int:resource_id>', methods=['POST'])
+@rate_limit('review')
 def submit_review(resource_id):
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     rating = request.form.get('rating', type=int)
     review_text = request.form.get('review_text', '').strip()
     
     if not rating or rating < 1 or rating > 5:
         flash('Please provide a valid rating (1-5 stars)', 'error')
-        return redirect(url_for('resource_detail', resource_id=resource_id))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get user ID
-    cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
-    
-    # Check if user already reviewed this resource
-    existing_review = get_user_review(resource_id, user['id'])
+        return redirect(url_for('.resource_detail', resource_id=resource_id))
     
-    try:
-        if existing_review:
-            # Update existing review
-            cursor.execute('''
-                UPDATE reviews 
-                SET rating = ?, review_text = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE resource_id = ? AND user_id = ?
-            ''', (rating, review_text, resource_id, user['id']))
-            flash('Your review has been updated!', 'success')
-        else:
-            # Insert new review
-            cursor.execute('''
-                INSERT INTO reviews (resource_id, user_id, rating, review_text)
-                VALUES (?, ?, ?, ?)
-            ''', (resource_id, user['id'], rating, review_text))
-            flash('Your review has been submitted!', 'success')
+    with db.connect() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        if not db.get_resource_with_uploader(conn, resource_id):
+            flash('Resource not found!', 'error')
+            return redirect(url_for('.access_resources'))
         
-        conn.commit()
-    except sqlite3.IntegrityError:
-        flash('Error submitting review. Please try again.', 'error')
-    finally:
-        conn.close()
+        try:
+            if db.save_review(conn, resource_id, user['id'], rating, review_text):
+                flash('Your review has been updated!', 'success')
+            else:
+                flash('Your review has been submitted!', 'success')
+            mark_write()
+        except conn.backend.IntegrityError:
+            conn.rollback()
+            flash('Error submitting review. Please try again.', 'error')
     
-    return redirect(url_for('resource_detail', resource_id=resource_id))
+    return redirect(url_for('.resource_detail', resource_id=resource_id))
 
 
-@app.route('/delete_review/<int:resource_id>')
+@bp.route('/delete_review/<int:resource_id>')
 def delete_review(resource_id):
     if 'user' not in session:
-        return redirect(url_for('login'))
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get user ID
-    cursor.execute('SELECT id FROM users WHERE email = ?', (session['user'],))
-    user = cursor.fetchone()
+        return redirect(url_for('.login'))
     
-    # Delete review
-    cursor.execute('''
-        DELETE FROM reviews 
-        WHERE resource_id = ? AND user_id = ?
-    ''', (resource_id, user['id']))
-    
-    conn.commit()
-    conn.close()
+    with db.connect() as conn:
+        user = db.get_user_by_email(conn, session['user'])
+        
+        # Delete review
+        db.delete_review(conn, resource_id, user['id'])
+        mark_write()
     
     flash('Your review has been deleted!', 'success')
-    return redirect(url_for('resource_detail', resource_id=resource_id))
+    return redirect(url_for('.resource_detail', resource_id=resource_id))
 
 
-@app.route('/get_student_info', methods=['GET'])
+@bp.route('/get_student_info', methods=['GET'])
 def get_student_info():
     if session.get('user_type') != 'student' and session.get('user_type') != 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # prefer student_id if present
-    sid = session.get('student_id')
-    if sid:
-        cursor.execute('SELECT * FROM users WHERE id = ?', (sid,))
-    else:
-        cursor.execute('SELECT * FROM users WHERE email = ?', (session.get('user'),))
-    user = cursor.fetchone()
-    conn.close()
-
+    
+    with read_connection() as conn:
+        # prefer student_id if present
+        sid = session.get('student_id')
+        if sid:
+            user = db.get_user_by_id(conn, sid)
+        else:
+            user = db.get_user_by_email(conn, session.get('user'))
+    
     if not user:
         return jsonify({'success': False, 'message': 'Student not found'}), 404
-
+    
     # we don't have a USN column in the current schema; synthesize one using id
     usn = f"U{user['id']:04d}"
-
+    
     return jsonify({
         'success': True,
         'student': {
@@ -835,10 +818,186 @@ def get_student_info():
         }
     })
 
-@app.route('/logout')
+# Admin moderation. Bulk operations take JSON ({"ids": [...], ...}); requiring a
+# JSON body also keeps plain cross-site form posts out.
+ADMIN_BATCH_LIMIT = 10000
+
+def admin_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if session.get('user_type') != 'admin':
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
+def admin_resource_ids(data):
+    """The list of resource ids in an admin request body, or None if invalid"""
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not 0 < len(ids) <= ADMIN_BATCH_LIMIT:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+def remove_files_later(filenames):
+    """Delete uploaded files in a background thread so the response doesn't wait on the disk.
+
+    Files left behind if the process exits first are orphans that
+    `flask reconcile-uploads --fix` removes.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    def cleanup():
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(folder, filename))
+            except FileNotFoundError:
+                pass
+    threading.Thread(target=cleanup, daemon=True).start()
+
+def invalidate_after_moderation():
+    # Counts and aggregates of other users changed, not just the admin's own
+    invalidate_catalog_cache()
+    _user_stats_cache.clear()
+    mark_write()
+
+@bp.route('/api/admin/resources/delete', methods=['POST'])
+@rate_limit('admin')
+@admin_required
+def admin_delete_resources():
+    ids = admin_resource_ids(request.get_json(silent=True))
+    if ids is None:
+        return jsonify({'success': False, 'message': f'Provide "ids": a list of up to {ADMIN_BATCH_LIMIT} resource ids'}), 400
+    
+    with db.connect() as conn:
+        deleted, filenames = db.delete_resources(conn, ids)
+    remove_files_later(filenames)
+    invalidate_after_moderation()
+    
+    return jsonify({'success': True, 'deleted': deleted})
+
+@bp.route('/api/admin/resources/update', methods=['POST'])
+@rate_limit('admin')
+@admin_required
+def admin_update_resources():
+    data = request.get_json(silent=True)
+    ids = admin_resource_ids(data)
+    if ids is None:
+        return jsonify({'success': False, 'message': f'Provide "ids": a list of up to {ADMIN_BATCH_LIMIT} resource ids'}), 400
+    
+    privacy = data.get('privacy')
+    tags = data.get('tags')
+    if privacy is not None and privacy not in ('Public', 'Private'):
+        return jsonify({'success': False, 'message': 'privacy must be "Public" or "Private"'}), 400
+    if tags is not None and not isinstance(tags, str):
+        return jsonify({'success': False, 'message': 'tags must be a comma separated string'}), 400
+    if privacy is None and tags is None:
+        return jsonify({'success': False, 'message': 'Nothing to update: give privacy and/or tags'}), 400
+    if tags is not None:
+        tags = ', '.join(tag.strip() for tag in tags.split(',') if tag.strip())
+    
+    with db.connect() as conn:
+        updated = db.update_resources(conn, ids, privacy=privacy, tags=tags)
+    invalidate_after_moderation()
+    
+    return jsonify({'success': True, 'updated': updated})
+
+@bp.route('/api/admin/reviews/purge', methods=['POST'])
+@rate_limit('admin')
+@admin_required
+def admin_purge_reviews():
+    data = request.get_json(silent=True)
+    user_id = data.get('user_id') if isinstance(data, dict) else None
+    if not isinstance(user_id, int) or isinstance(user_id, bool):
+        return jsonify({'success': False, 'message': 'Provide "user_id" of the reviewer'}), 400
+    
+    with db.connect() as conn:
+        if not db.get_user_by_id(conn, user_id):
+            return jsonify({'success': False, 'message': 'User not found'}), 404
+        resource_ids = db.purge_user_reviews(conn, user_id)
+    invalidate_after_moderation()
+    
+    return jsonify({'success': True, 'deleted': len(resource_ids)})
+
+@bp.route('/logout')
 def logout():
     session.pop('user', None)
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
+
+@click.command('init-db')
+def init_db_command():
+    """Create folders and create/migrate the database schema."""
+    init_storage()
+    click.echo('Database initialized')
+
+@click.command('archive-downloads')
+@click.option('--keep-months', default=6, show_default=True, type=click.IntRange(min=1),
+              help='Months of history to keep writable (the current month always is).')
+def archive_downloads_command(keep_months):
+    """Archive old download history partitions as read-only files."""
+    if db.backend.name != 'sqlite':
+        click.echo(f"Nothing to archive on {db.backend.name}: download_history is a single table, "
+                   "partition it by download_date in the database server instead")
+        return
+    archived = db.archive_download_history(keep_months)
+    click.echo(f"Archived {len(archived)} partition(s): {', '.join(archived) or 'none'}")
+
+@click.command('compact-downloads')
+@click.option('--minutes', type=int, default=None, help='Dedup window in minutes (default: DOWNLOAD_DEDUP_MINUTES).')
+def compact_downloads_command(minutes):
+    """Collapse repeat downloads in history into download_count."""
+    removed = db.compact_download_history(minutes)
+    click.echo(f"Removed {removed} duplicate download row(s)")
+
+@click.command('reconcile-uploads')
+@click.option('--fix', is_flag=True, help='Delete orphan files and record actual sizes.')
+@click.option('--delete-missing', is_flag=True,
+              help='Delete resources whose file is missing, unless most checked resources are.')
+@click.option('--limit', type=int, default=None, help='Check at most this many files; the next run continues from there.')
+@click.option('--restart', is_flag=True, help='Ignore the saved position and start from the first file.')
+@click.option('--grace-minutes', default=60, show_default=True, help='Skip files newer than this (uploads in progress).')
+def reconcile_uploads_command(fix, delete_missing, limit, restart, grace_minutes):
+    """Find orphan files, missing files and size mismatches in uploads/."""
+    start_after = '' if restart else reconcile.load_checkpoint()
+    if start_after:
+        click.echo(f"Continuing after {start_after}")
+    
+    counts = {'orphan': 0, 'missing': 0, 'size': 0}
+    missing = []
+    with db.connect() as conn:
+        reconciler = reconcile.Reconciler(conn, current_app.config['UPLOAD_FOLDER'], grace_minutes)
+        for issue in reconciler.run(start_after, limit):
+            counts[issue['kind']] += 1
+            if issue['kind'] == 'orphan':
+                message = f"orphan   {issue['filename']} ({issue['size']} bytes, no resource)"
+            elif issue['kind'] == 'missing':
+                message = f"missing  {issue['filename']} (resource {issue['resource_id']})"
+            else:
+                message = f"size     {issue['filename']} (resource {issue['resource_id']}: recorded {issue['recorded']}, on disk {issue['size']})"
+            if issue['kind'] == 'missing':
+                missing.append(issue)
+            elif fix:
+                reconciler.fix(issue)
+                message += ' - fixed'
+            click.echo(message)
+        
+        # Only decided once the whole batch is known: an unmounted folder makes every row look missing
+        if delete_missing and missing:
+            if reconciler.too_many_missing(len(missing)):
+                click.echo(f"Not deleting: {len(missing)} of {reconciler.rows} checked resource(s) are missing "
+                           f"their file. Check that UPLOAD_FOLDER is right and mounted, "
+                           f"then run again with --restart.")
+            else:
+                for issue in missing:
+                    reconciler.fix(issue)
+                invalidate_catalog_cache()
+                click.echo(f"Deleted {len(missing)} resource(s) whose file is missing")
+    
+    reconcile.save_checkpoint('' if reconciler.complete else reconciler.last)
+    click.echo(f"Checked {reconciler.checked} file(s): {counts['orphan']} orphan, "
+               f"{counts['missing']} missing, {counts['size']} size mismatch")
+    if not reconciler.complete:
+        click.echo(f"Stopped after {reconciler.last}; run again to continue")
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    init_storage()
+    create_app().run(debug=True)
@@ -1,4 +1,5 @@
 import sqlite3
+import os
 
 # Connect to the database
 conn = sqlite3.connect('users.db')
@@ -141,11 +142,48 @@ else:
     print("\n✗ Download History table DOES NOT EXIST")
     print("  The table should be created automatically when the app runs.")
 
+# Check download history partitions (one SQLite file per month under history/)
+history_files = []
+for folder in ('history', os.path.join('history', 'archive')):
+    if os.path.exists(folder):
+        history_files += [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                          if name.startswith('downloads_') and name.endswith('.db')]
+
+if history_files:
+    print("\n\nDownload History Partitions:")
+    print("-" * 60)
+    for path in history_files:
+        part = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        rows = part.execute("SELECT COUNT(*) FROM download_history").fetchone()[0]
+        part.close()
+        print(f"  {path:45} | {rows} downloads")
+
+if os.path.exists(os.path.join('history', 'download_totals.db')):
+    totals = sqlite3.connect(os.path.join('history', 'download_totals.db'))
+    total, unique = totals.execute(
+        "SELECT COALESCE(SUM(download_count), 0), COUNT(*) FROM download_totals").fetchone()
+    totals.close()
+    print(f"\nTotal Downloads (all partitions): {total} ({unique} user/resource pairs)")
+
 # Check resources table
 cursor.execute("SELECT COUNT(*) as count FROM resources")
 resource_count = cursor.fetchone()['count']
 print(f"\n\nTotal Resources in Database: {resource_count}")
 
+# Stored file compression (UPLOAD_COMPRESSION), if the columns exist yet
+cursor.execute("PRAGMA table_info(resources)")
+if 'content_encoding' in [col['name'] for col in cursor.fetchall()]:
+    cursor.execute("""
+        SELECT content_encoding, COUNT(*) as files,
+               SUM(file_size) as original, SUM(stored_size) as stored
+        FROM resources
+        WHERE content_encoding IS NOT NULL
+        GROUP BY content_encoding
+    """)
+    for row in cursor.fetchall():
+        print(f"  {row['files']} files stored with {row['content_encoding']}: "
+              f"{row['original']} -> {row['stored']} bytes ({row['stored'] / row['original']:.0%})")
+
 # Check users table
 cursor.execute("SELECT COUNT(*) as count FROM users")
 user_count = cursor.fetchone()['count']
@@ -0,0 +1,264 @@
+"""Upload validation by content sniffing.
+
+The extension of an uploaded file says what it should be; the bytes say what
+it is. UploadWriter receives the upload chunk by chunk while the multipart
+body is being parsed and writes it to a temporary file of its own in the
+uploads folder, checking as it goes:
+
+* the first bytes must carry the magic number of the extension's format
+  (``%PDF-``, JPEG/PNG signatures, ``PK`` for ZIP, the OLE2 header for legacy
+  .doc/.ppt); anything else is rejected before a byte is written to disk,
+* .txt files must not contain NUL bytes (which also rules out renamed
+  executables), checked on every chunk; UTF-16 files, which start with a
+  byte order mark, must instead decode without NUL characters,
+* ZIP based files must end in a readable central directory, and .docx/.pptx
+  must contain the Word/PowerPoint parts. The tail of the stream is kept in
+  memory for this, so the file is never read back.
+
+A rejected upload raises UploadRejected, which stops parsing the rest of the
+request body and removes anything already written. An accepted one is renamed
+to its final name by finish(), so nothing else ever sees a partial file.
+
+When storage compression is on (see storage.py) a compressed copy is written
+alongside in the same pass, and kept instead of the original if it is smaller.
+"""
+import codecs
+import hashlib
+import os
+import struct
+import tempfile
+
+import storage
+
+SNIFF_BYTES = 1024  # PDF allows junk before %PDF- within the first 1 KB
+UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)  # Notepad's "Unicode"
+TAIL_BYTES = 1024 * 1024  # enough for the central directory of any Office file
+
+# extension -> (format the content must sniff as, MIME type to serve it with)
+FORMATS = {
+    'pdf': ('pdf', 'application/pdf'),
+    'jpg': ('jpeg', 'image/jpeg'),
+    'jpeg': ('jpeg', 'image/jpeg'),
+    'png': ('png', 'image/png'),
+    'zip': ('zip', 'application/zip'),
+    'docx': ('zip', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    'pptx': ('zip', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+    'doc': ('ole', 'application/msword'),
+    'ppt': ('ole', 'application/vnd.ms-powerpoint'),
+    'txt': ('text', 'text/plain'),
+}
+
+# Parts an Office Open XML package must contain, besides [Content_Types].xml
+OFFICE_PARTS = {
+    'docx': 'word/',
+    'pptx': 'ppt/',
+}
+
+
+class UploadRejected(Exception):
+    """The uploaded content is not what its extension claims"""
+
+
+def sniff(head, expected=None):
+    """Identify a file format from its first bytes.
+
+    `expected` is the format the extension claims; only a claimed PDF may
+    have its header after some leading junk, so text that merely mentions
+    %PDF- is still text.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return 'zip'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'ole'
+    if head.startswith(b'%PDF-') or (expected == 'pdf' and b'%PDF-' in head[:SNIFF_BYTES]):
+        return 'pdf'
+    if head.startswith(UTF16_BOMS) or b'\x00' not in head:
+        return 'text'
+    return None
+
+
+def zip_entry_names(tail, total_size):
+    """Names in a ZIP's central directory, read from the last bytes of the file.
+
+    Returns None if the archive is damaged, or an empty list if the directory
+    did not fit in the tail (only possible for very large archives).
+    """
+    eocd = tail.rfind(b'PK\x05\x06', max(0, len(tail) - 65557))
+    if eocd < 0 or len(tail) - eocd < 22:
+        return None
+    entries, cd_size, cd_offset = struct.unpack('<xxxxxxxxxxHII', bytes(tail[eocd:eocd + 20]))
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+        return []  # ZIP64, nothing to check at these sizes
+    tail_start = total_size - len(tail)
+    if cd_offset + cd_size > tail_start + eocd:
+        return None
+    if cd_offset < tail_start:
+        return []
+
+    names = []
+    pos = cd_offset - tail_start
+    for _ in range(entries):
+        if tail[pos:pos + 4] != b'PK\x01\x02' or pos + 46 > eocd:
+            return None
+        name_length, extra_length, comment_length = struct.unpack('<HHH', bytes(tail[pos + 28:pos + 34]))
+        names.append(bytes(tail[pos + 46:pos + 46 + name_length]).decode('utf-8', 'replace'))
+        pos += 46 + name_length + extra_length + comment_length
+    return names
+
+
+class UploadWriter:
+    """Writable file object that werkzeug streams one uploaded file into.
+
+    Hashes, sizes and validates the content on the way to `path`; call
+    finish() once parsing is done to run the end-of-file checks and move the
+    file into place. Until then it is written under a unique temporary name,
+    which closing an unfinished writer deletes.
+    """
+
+    def __init__(self, path, extension, compression=''):
+        self.path = path
+        self.extension = extension
+        self.expected, self.mimetype = FORMATS[extension]
+        self.file = None
+        self.head = b''
+        self.tail = bytearray()
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.is_utf8 = True
+        self.utf16 = None
+        self.finished = False
+        self.compression = compression
+        self.compressor = None
+        self.compressed = None
+        self.content_encoding = None
+        self.stored_size = 0
+
+    def write(self, data):
+        if self.file is None:
+            self.head += data
+            if len(self.head) < SNIFF_BYTES:
+                return len(data)
+            self.start()
+        else:
+            self.consume(data)
+        return len(data)
+
+    def start(self):
+        """Check the magic bytes, then open the destination file"""
+        head, self.head = self.head, b''
+        if sniff(head, self.expected) != self.expected:
+            raise UploadRejected(f'File content does not match its .{self.extension} extension!')
+        if self.expected == 'text' and head.startswith(UTF16_BOMS):
+            self.utf16 = codecs.getincrementaldecoder('utf-16')()
+        self.file = self.open_temp('.part')
+        if self.compression:
+            self.compressor = storage.compressor(self.compression)
+            self.compressed = self.open_temp('.compressing')
+        self.consume(head)
+
+    def open_temp(self, suffix):
+        """Create a file no other upload can be using, next to `path`"""
+        fd, path = tempfile.mkstemp(suffix, os.path.basename(self.path) + '.', os.path.dirname(self.path) or '.')
+        os.close(fd)
+        return open(path, 'wb')
+
+    def consume(self, data):
+        if self.expected == 'text' and self.utf16:
+            self.check_utf16(data)
+        elif self.expected == 'text':
+            if b'\x00' in data:
+                self.close()
+                raise UploadRejected('Text files cannot contain binary data!')
+            if self.is_utf8:
+                try:
+                    self.utf8.decode(data)
+                except UnicodeDecodeError:
+                    self.is_utf8 = False
+        elif self.expected == 'zip':
+            self.tail += data
+            if len(self.tail) > TAIL_BYTES:
+                del self.tail[:len(self.tail) - TAIL_BYTES]
+        self.digest.update(data)
+        self.size += len(data)
+        self.file.write(data)
+        if self.compressor:
+            self.write_compressed(self.compressor.compress(data))
+
+    def check_utf16(self, data, final=False):
+        try:
+            text = self.utf16.decode(data, final)
+        except UnicodeDecodeError:
+            text = '\x00'
+        if '\x00' in text:
+            self.close()
+            raise UploadRejected('Text files cannot contain binary data!')
+
+    def write_compressed(self, data):
+        self.stored_size += len(data)
+        self.compressed.write(data)
+
+    def finish(self):
+        """Run the end-of-file checks; returns the MIME type to store"""
+        if self.file is None:
+            if not self.head:
+                raise UploadRejected('The uploaded file is empty!')
+            self.start()
+        if self.utf16:
+            self.check_utf16(b'', final=True)
+            self.mimetype = 'text/plain; charset=utf-16'
+        elif self.expected == 'text' and self.is_utf8:
+            try:
+                self.utf8.decode(b'', final=True)
+                self.mimetype = 'text/plain; charset=utf-8'
+            except UnicodeDecodeError:
+                pass
+        if self.expected == 'zip':
+            names = zip_entry_names(self.tail, self.size)
+            if names is None:
+                self.close()
+                raise UploadRejected('The ZIP archive is damaged or incomplete!')
+            part = OFFICE_PARTS.get(self.extension)
+            if part and not ('[Content_Types].xml' in names and any(name.startswith(part) for name in names)):
+                self.close()
+                raise UploadRejected(f'File is not a valid .{self.extension} document!')
+        self.file.close()
+        stored = self.file.name
+        if self.compressor:
+            self.write_compressed(self.compressor.flush())
+            self.compressed.close()
+            if self.stored_size <= self.size * storage.MAX_RATIO:
+                os.remove(stored)
+                stored = self.compressed.name
+                self.content_encoding = self.compression
+            else:
+                os.remove(self.compressed.name)
+        if not self.content_encoding:
+            self.stored_size = self.size
+        os.replace(stored, self.path)
+        self.finished = True
+        return self.mimetype
+
+    @property
+    def sha256(self):
+        return self.digest.hexdigest()
+
+    # werkzeug rewinds the stream once the part has been received
+    def seek(self, offset, whence=0):
+        return 0
+
+    def close(self):
+        for f in (self.file, self.compressed):
+            if f is not None and not f.closed:
+                f.close()
+        if not self.finished:
+            for f in (self.file, self.compressed):
+                if f is not None:
+                    try:
+                        os.remove(f.name)
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,19 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Import the app and compile templates once in the master, then fork.
+# create_app() opens no database connections, so nothing is shared across the fork.
+preload_app = True
+
+
+def on_starting(server):
+    # memory:// rate limit buckets are per worker, so each worker allows the full limit
+    if (workers > 1 and os.environ.get('RATELIMIT_ENABLED', '1') != '0'
+            and os.environ.get('RATELIMIT_STORAGE_URL', 'memory://').startswith('memory://')):
+        server.log.warning('Rate limits use in-process buckets with %d workers, so each limit is '
+                           'multiplied by %d; set RATELIMIT_STORAGE_URL=redis://... to share them',
+                           workers, workers)
@@ -0,0 +1,186 @@
+"""Preview thumbnails for resource_detail.
+
+The first pages of a PDF, or an uploaded image, are rendered to small WebP
+thumbnails so students can check a resource before downloading it. Rendering
+needs ``Pillow`` (plus ``PyMuPDF`` for PDFs); without them previews are simply
+not offered.
+
+Thumbnails are cached on disk under PREVIEW_FOLDER, keyed by the SHA-256 of
+the uploaded file, so identical uploads share one entry and an entry never goes
+stale. The cache is bounded to PREVIEW_CACHE_BYTES: a hit touches the file's
+mtime and, once the folder grows past the limit, the least recently used
+thumbnails are removed.
+"""
+import hashlib
+import importlib.util
+import os
+import threading
+import time
+
+import storage
+
+PREVIEW_FOLDER = os.environ.get('PREVIEW_FOLDER', 'previews')
+PREVIEW_CACHE_BYTES = int(os.environ.get('PREVIEW_CACHE_BYTES', 256 * 1024 * 1024))
+PREVIEW_PAGES = 3  # PDF pages offered as previews
+PREVIEW_WIDTH = 600  # pixels
+PREVIEW_QUALITY = 70  # WebP quality
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+
+_lock = threading.Lock()
+_cache_bytes = None  # running total for this process, rescanned on eviction
+
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ValueError:
+        return False
+
+
+HAS_PIL = _installed('PIL')
+HAS_PDF = HAS_PIL and (_installed('pymupdf') or _installed('fitz'))
+
+
+def extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def preview_pages(filename):
+    """How many preview pages to offer for a stored file (0 = no preview)"""
+    ext = extension(filename)
+    if ext == 'pdf' and HAS_PDF:
+        return PREVIEW_PAGES
+    if ext in IMAGE_EXTENSIONS and HAS_PIL:
+        return 1
+    return 0
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(file_hash, page):
+    return os.path.join(PREVIEW_FOLDER, file_hash[:2], f'{file_hash}-{page}.webp')
+
+
+def get_preview(path, file_hash, page, encoding=None):
+    """Path of the cached WebP thumbnail for one page, rendering it on a miss.
+
+    Returns None if the page does not exist or the file cannot be rendered.
+    """
+    target = cache_path(file_hash, page)
+    try:
+        os.utime(target)  # mark as recently used
+        # An empty entry records that this page has no preview
+        return target if os.path.getsize(target) else None
+    except FileNotFoundError:
+        pass
+
+    data = render(path, page, encoding)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Write to a temp file first so other workers never serve a partial image
+    temp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data or b'')
+    os.replace(temp, target)
+    _added(len(data or b''))
+    return target if data else None
+
+
+def render(path, page, encoding=None):
+    """Render one page of a stored file (compressed with `encoding`) to WebP bytes"""
+    from io import BytesIO
+    from PIL import Image
+
+    ext = extension(path)
+    try:
+        if ext == 'pdf':
+            try:
+                import pymupdf
+            except ImportError:
+                import fitz as pymupdf  # PyMuPDF before 1.24
+            if encoding:
+                with storage.open_stored(path, encoding) as f:
+                    doc = pymupdf.open(stream=f.read(), filetype='pdf')
+            else:
+                doc = pymupdf.open(path)
+            with doc:
+                if page > min(doc.page_count, PREVIEW_PAGES):
+                    return None
+                pdf_page = doc.load_page(page - 1)
+                # Rasterize straight at thumbnail width rather than full size
+                zoom = PREVIEW_WIDTH / max(pdf_page.rect.width, 1)
+                pixmap = pdf_page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+                image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+        elif ext in IMAGE_EXTENSIONS:
+            if page != 1:
+                return None
+            image = Image.open(path)
+            image.draft('RGB', (PREVIEW_WIDTH, PREVIEW_WIDTH * 4))  # cheap JPEG downscale on decode
+            image.thumbnail((PREVIEW_WIDTH, PREVIEW_WIDTH * 4))
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        else:
+            return None
+    except Exception as e:
+        print(f"Error rendering preview for {path}: {e}")
+        return None
+
+    out = BytesIO()
+    image.save(out, 'WEBP', quality=PREVIEW_QUALITY, method=4)
+    return out.getvalue()
+
+
+# Size bound
+
+def _scan():
+    """All cached thumbnails as (mtime, size, path)"""
+    entries = []
+    for root, _, files in os.walk(PREVIEW_FOLDER):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith('.tmp') and time.time() - st.st_mtime > 3600:
+                os.remove(path)  # left behind by a crashed worker
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _added(size):
+    global _cache_bytes
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(entry[1] for entry in _scan())
+        else:
+            _cache_bytes += size
+        if _cache_bytes > PREVIEW_CACHE_BYTES:
+            _cache_bytes = evict(PREVIEW_CACHE_BYTES * 9 // 10)
+
+
+def evict(target_bytes):
+    """Remove least recently used thumbnails until the cache fits target_bytes.
+
+    Other workers add to the folder too, so the total is recounted from disk.
+    Returns the size left.
+    """
+    entries = sorted(_scan())
+    total = sum(entry[1] for entry in entries)
+    for _, size, path in entries:
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
@@ -0,0 +1,142 @@
+"""Token bucket rate limiting for Flask routes.
+
+Each limited route gets a bucket per logged-in user; anonymous requests (such
+as login attempts) share a bucket per client IP. Logged-in users are not
+also charged to their IP, so students behind one campus NAT do not use up
+each other's limits.
+
+A bucket holds up to ``capacity`` tokens and refills at ``capacity / period``
+tokens per second; every request takes one token. When the bucket is empty
+the request is rejected with ``429 Too Many Requests`` and a ``Retry-After``
+header.
+
+Buckets live in process memory by default, so with several gunicorn workers
+every limit is effectively multiplied by the worker count (gunicorn.conf.py
+warns about this). Set ``RATELIMIT_STORAGE_URL=redis://localhost:6379/0``
+(needs the ``redis`` package, any Redis-compatible server works) so all
+workers share them.
+
+The IP is ``request.remote_addr``; behind a reverse proxy set
+``TRUSTED_PROXIES`` (see create_app) or every client shares the proxy's bucket.
+"""
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+
+
+class MemoryStore:
+    """Buckets in a dict guarded by a lock (per process)"""
+    max_keys = 100000  # when reached, the least recently used half is dropped
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self.buckets) >= self.max_keys:
+                self.prune(now)
+            self.buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def prune(self, now):
+        # Dropping a bucket forgets its debt, which an idle bucket has long
+        # since refilled anyway. Removing half at once keeps the cost per
+        # request constant on average even when every bucket is in use.
+        keep = sorted(self.buckets.items(), key=lambda item: item[1][1])[len(self.buckets) // 2:]
+        self.buckets = dict(keep)
+
+
+class RedisStore:
+    """Buckets in Redis hashes, updated atomically with a Lua script"""
+    script = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local last = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    '''
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.take_script = self.client.register_script(self.script)
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self.take_script(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0 if allowed else (1 - tokens) / rate
+
+
+def create_store(url):
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL: {url}')
+
+
+store = create_store(RATELIMIT_STORAGE_URL)
+
+
+def check_rate_limit(name, capacity, period):
+    """Take a token from the user's bucket, or the IP's if not logged in.
+
+    Returns the number of seconds the client should wait, or 0 if allowed.
+    """
+    if session.get('user') and session.get('student_id'):
+        key = f"{name}:user:{session['student_id']}"
+    else:
+        key = f'{name}:ip:{request.remote_addr}'
+    allowed, retry_after = store.take(key, capacity, capacity / period)
+    return 0 if allowed else retry_after
+
+
+def too_many_requests(wait):
+    retry_after = str(max(1, math.ceil(wait)))
+    message = f'Too many requests. Please try again in {retry_after} seconds.'
+    if request.path.startswith('/api/'):
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = current_app.response_class(message, mimetype='text/plain')
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+def rate_limit(name):
+    """Limit a route using app.config['RATE_LIMITS'][name] = (capacity, period)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            limit = current_app.config.get('RATE_LIMITS', {}).get(name)
+            if limit and current_app.config.get('RATELIMIT_ENABLED', True):
+                wait = check_rate_limit(name, *limit)
+                if wait:
+                    return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
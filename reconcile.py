@@ -0,0 +1,166 @@
+"""Consistency check between the uploads folder and the resources table.
+
+Uploads write the file before inserting the row and deletes remove the file
+before the row, so a crash in between leaves an orphan file or a row whose
+file is missing. Reconciler walks both sides in filename order, like a merge
+join, and reports:
+
+* orphan  - a file in uploads/ that no resource points to,
+* missing - a resource whose file is gone,
+* size    - a file whose size on disk differs from the recorded one.
+
+Neither side is loaded whole: rows come from the database in keyset pages
+and the folder listing is sorted in runs of RUN_SIZE names, spilled to temp
+files and merged. A run can stop after `limit` names and the next one picks
+up after the last name (saved in CHECKPOINT_FILE by the CLI command).
+
+Deleting rows for missing files is destructive, so it is a separate step:
+if uploads/ is not mounted every row looks missing, and too_many_missing()
+lets the caller refuse instead of emptying the catalog.
+"""
+import heapq
+import os
+import tempfile
+import time
+
+import db
+
+RUN_SIZE = 100000  # folder entries sorted in memory at a time
+CHECKPOINT_FILE = 'reconcile.checkpoint'
+MAX_MISSING_FRACTION = 0.5  # of checked rows; more than this points at a wrong or unmounted folder
+
+
+def sorted_files(folder, start_after='', run_size=RUN_SIZE):
+    """Yield names of the files in `folder` after `start_after`, sorted"""
+    runs, names = [], []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # Dotfiles (.gitkeep etc.) are not uploads
+            if entry.name > start_after and not entry.name.startswith('.') and '\n' not in entry.name \
+                    and entry.is_file(follow_symlinks=False):
+                names.append(entry.name)
+                if len(names) >= run_size:
+                    runs.append(_spill(names))
+                    names = []
+    names.sort()
+    try:
+        yield from heapq.merge(names, *(_read_run(run) for run in runs))
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _spill(names):
+    run = tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogateescape')
+    run.writelines(name + '\n' for name in sorted(names))
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    for line in run:
+        yield line[:-1]
+
+
+class Reconciler:
+    """Finds (and optionally fixes) mismatches between uploads/ and resources"""
+
+    def __init__(self, conn, folder, grace_minutes=60):
+        self.conn = conn
+        self.folder = folder
+        # Files this recent may belong to an upload that has not inserted its row yet
+        self.grace_seconds = grace_minutes * 60
+        self.last = ''
+        self.complete = False
+        self.checked = 0
+        self.rows = 0
+
+    def run(self, start_after='', limit=None):
+        """Yield issues for names after `start_after`, stopping after `limit` names.
+
+        Afterwards `last` is the last name checked, `rows` the number of
+        resources checked and `complete` tells whether the end of both
+        listings was reached.
+        """
+        self.last, self.complete, self.checked, self.rows = start_after, False, 0, 0
+        files = sorted_files(self.folder, start_after)
+        rows = db.iter_resource_files(self.conn, start_after)
+        file, row = next(files, None), next(rows, None)
+
+        while file is not None or row is not None:
+            name = min(n for n in (file, row and row['filename']) if n is not None)
+            if name != self.last:
+                if limit is not None and self.checked >= limit:
+                    return
+                self.checked += 1
+                self.last = name
+
+            if row is None or (file is not None and file < row['filename']):
+                issue = self.check_orphan(file)
+                file = next(files, None)
+            elif file is None or row['filename'] < file:
+                issue = {'kind': 'missing', 'filename': row['filename'], 'resource_id': row['id']}
+                row = next(rows, None)
+                self.rows += 1
+            else:
+                issue = self.check_size(file, row)
+                row = next(rows, None)
+                self.rows += 1
+                # Several rows may point at the same file
+                if row is None or row['filename'] != file:
+                    file = next(files, None)
+            if issue:
+                yield issue
+        self.complete = True
+
+    def check_orphan(self, name):
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except FileNotFoundError:
+            return None  # removed since the listing
+        if time.time() - st.st_mtime < self.grace_seconds:
+            return None
+        return {'kind': 'orphan', 'filename': name, 'size': st.st_size}
+
+    def check_size(self, name, row):
+        try:
+            size = os.stat(os.path.join(self.folder, name)).st_size
+        except FileNotFoundError:
+            return {'kind': 'missing', 'filename': name, 'resource_id': row['id']}
+        recorded = row['stored_size'] if row['stored_size'] is not None else row['file_size']
+        if recorded is None or int(recorded) == size:
+            return None
+        return {'kind': 'size', 'filename': name, 'resource_id': row['id'], 'recorded': int(recorded),
+                'size': size, 'content_encoding': row['content_encoding']}
+
+    def too_many_missing(self, missing):
+        """Whether `missing` rows out of those checked is too many to delete"""
+        return missing > self.rows * MAX_MISSING_FRACTION
+
+    def fix(self, issue):
+        """Delete orphan files and dangling rows, record actual sizes"""
+        if issue['kind'] == 'orphan':
+            try:
+                os.remove(os.path.join(self.folder, issue['filename']))
+            except FileNotFoundError:
+                pass
+        elif issue['kind'] == 'missing':
+            db.delete_resource(self.conn, issue['resource_id'])
+        elif issue['kind'] == 'size':
+            db.set_stored_size(self.conn, issue['resource_id'], issue['size'], issue['content_encoding'])
+
+
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, encoding='utf-8', errors='surrogateescape') as f:
+            return f.read().rstrip('\n')
+    except FileNotFoundError:
+        return ''
+
+
+def save_checkpoint(name):
+    if name:
+        with open(CHECKPOINT_FILE, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(name + '\n')
+    elif os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
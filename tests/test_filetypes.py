@@ -0,0 +1,72 @@
+"""Tests for upload content validation in filetypes.py."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filetypes  # noqa: E402
+
+
+def upload(tmp_path, extension, data, chunk_size=700):
+    """Stream data through an UploadWriter in chunks; returns the MIME type"""
+    writer = filetypes.UploadWriter(str(tmp_path / f'upload.{extension}'), extension)
+    try:
+        for start in range(0, len(data), chunk_size):
+            writer.write(data[start:start + chunk_size])
+        return writer.finish()
+    finally:
+        writer.close()
+
+
+def test_text_mentioning_pdf_header_is_text(tmp_path):
+    assert upload(tmp_path, 'txt', b'The %PDF- header may follow junk.\n' * 50) == 'text/plain; charset=utf-8'
+
+
+def test_image_metadata_mentioning_pdf_header(tmp_path):
+    assert upload(tmp_path, 'jpg', b'\xff\xd8\xff\xe1 Exif %PDF-1.4 ' + b'\x00' * 2000) == 'image/jpeg'
+
+
+def test_pdf_header_after_junk(tmp_path):
+    assert upload(tmp_path, 'pdf', b'junk\r\n%PDF-1.7\n' + b'0' * 2000) == 'application/pdf'
+
+
+@pytest.mark.parametrize('encoding', ['utf-16', 'utf-16-le', 'utf-16-be'])
+def test_utf16_text_with_bom(tmp_path, encoding):
+    bom = {'utf-16': b'', 'utf-16-le': b'\xff\xfe', 'utf-16-be': b'\xfe\xff'}[encoding]
+    data = bom + ('Unit 3 notes\r\n' * 100).encode(encoding)
+    assert upload(tmp_path, 'txt', data) == 'text/plain; charset=utf-16'
+
+
+@pytest.mark.parametrize('data', [
+    b'MZ\x90\x00' + b'\x00' * 2000,  # renamed executable
+    b'\xff\xfe' + b'\x00\x00' * 1000,  # UTF-16 BOM followed by NULs
+    b'\xff\xfeA\x00\x00\xd8',  # unpaired surrogate
+])
+def test_binary_text_is_rejected(tmp_path, data):
+    with pytest.raises(filetypes.UploadRejected):
+        upload(tmp_path, 'txt', data)
+    assert os.listdir(tmp_path) == []
+
+
+def test_pdf_without_header_is_rejected(tmp_path):
+    with pytest.raises(filetypes.UploadRejected):
+        upload(tmp_path, 'pdf', b'plain text, not a PDF\n' * 100)
+
+
+def test_concurrent_uploads_to_one_name_do_not_clobber(tmp_path):
+    path = str(tmp_path / 'notes.txt')
+    first, second = filetypes.UploadWriter(path, 'txt'), filetypes.UploadWriter(path, 'txt')
+    first.write(b'first upload\n' * 100)
+    second.write(b'second upload\n' * 100)
+    first.finish()
+    first.close()
+    # The second upload turns out to be binary after the sniffed head
+    with pytest.raises(filetypes.UploadRejected):
+        second.write(b'\x00')
+    second.close()
+    with open(path, 'rb') as f:
+        assert f.read() == b'first upload\n' * 100
+    assert os.listdir(tmp_path) == ['notes.txt']
+
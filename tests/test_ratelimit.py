@@ -0,0 +1,33 @@
+"""Tests for the token buckets in ratelimit.py."""
+import os
+import sys
+
+from flask import Flask, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit  # noqa: E402
+
+
+def test_prune_keeps_the_most_recently_used_half(monkeypatch):
+    store = ratelimit.MemoryStore()
+    monkeypatch.setattr(store, 'max_keys', 4)
+    for key in 'abcde':
+        store.take(key, 10, 1)
+    assert sorted(store.buckets) == ['c', 'd', 'e']
+
+
+def test_logged_in_users_behind_one_ip_have_separate_buckets(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'store', ratelimit.MemoryStore())
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        session.update(user='A', student_id=1)
+        assert ratelimit.check_rate_limit('download', 1, 60) == 0
+        assert ratelimit.check_rate_limit('download', 1, 60) > 0
+        session.update(user='B', student_id=2)
+        assert ratelimit.check_rate_limit('download', 1, 60) == 0
+        # Anonymous requests from the same address share one bucket
+        session.clear()
+        assert ratelimit.check_rate_limit('download', 1, 60) == 0
+        assert ratelimit.check_rate_limit('download', 1, 60) > 0
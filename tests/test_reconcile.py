@@ -0,0 +1,120 @@
+"""Tests for the uploads/resources consistency check in reconcile.py."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import reconcile  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, 'backend', db.SQLiteBackend(str(tmp_path / 'users.db')))
+    db.init_db()
+    conn = db.connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'uploads'
+    path.mkdir()
+    return path
+
+
+def add_file(folder, name, size=100):
+    (folder / name).write_bytes(b'x' * size)
+
+
+def add_resource(conn, filename, size=100):
+    user = db.get_user_by_email(conn, 'student@example.com')
+    user_id = user['id'] if user else db.create_user(conn, 'Student', 'student@example.com', 'hash', '9999999999',
+                                                      'RVCE', 'CSE', '5')
+    return db.create_resource(conn, user_id, 'Notes', 'DBMS', '5', 'Notes', '2024', 'desc', 'sql',
+                              filename, filename, size, 'Public')
+
+
+def issues(conn, folder, **kwargs):
+    reconciler = reconcile.Reconciler(conn, str(folder), grace_minutes=0)
+    return reconciler, [(issue['kind'], issue['filename']) for issue in reconciler.run(**kwargs)]
+
+
+def test_orphan_missing_and_size(conn, folder):
+    add_file(folder, 'a.pdf')
+    add_file(folder, 'b.pdf', size=50)
+    add_file(folder, '.gitkeep')
+    add_resource(conn, 'b.pdf')
+    add_resource(conn, 'c.pdf')
+
+    reconciler, found = issues(conn, folder)
+    assert found == [('orphan', 'a.pdf'), ('size', 'b.pdf'), ('missing', 'c.pdf')]
+    assert reconciler.complete and reconciler.checked == 3 and reconciler.rows == 2
+
+
+def test_recent_files_are_not_orphans(conn, folder):
+    add_file(folder, 'uploading.pdf')
+    reconciler = reconcile.Reconciler(conn, str(folder), grace_minutes=60)
+    assert list(reconciler.run()) == []
+
+
+def test_fix_removes_orphans_and_records_sizes(conn, folder):
+    add_file(folder, 'a.pdf')
+    add_file(folder, 'b.pdf', size=50)
+    add_resource(conn, 'b.pdf')
+    reconciler = reconcile.Reconciler(conn, str(folder), grace_minutes=0)
+    for issue in list(reconciler.run()):
+        reconciler.fix(issue)
+    assert os.listdir(folder) == ['b.pdf']
+    assert issues(conn, folder)[1] == []
+
+
+def test_rows_sharing_a_file(conn, folder):
+    add_file(folder, 'shared.pdf')
+    add_resource(conn, 'shared.pdf')
+    add_resource(conn, 'shared.pdf')
+    add_resource(conn, 'shared.pdf', size=1)
+
+    reconciler, found = issues(conn, folder)
+    assert found == [('size', 'shared.pdf')]
+    assert reconciler.checked == 1 and reconciler.rows == 3
+
+
+def test_sorted_files_spills_runs(folder):
+    names = [f'{i:03d}.pdf' for i in range(10)]
+    for name in reversed(names):
+        add_file(folder, name, size=1)
+    assert list(reconcile.sorted_files(str(folder), run_size=3)) == names
+    assert list(reconcile.sorted_files(str(folder), '004.pdf', run_size=3)) == names[5:]
+
+
+def test_resume_after_limit(conn, folder):
+    for name in ('a.pdf', 'b.pdf', 'c.pdf', 'd.pdf'):
+        add_file(folder, name)
+    add_resource(conn, 'b.pdf', size=1)
+    add_resource(conn, 'e.pdf')
+
+    reconciler, found = issues(conn, folder, limit=2)
+    assert found == [('orphan', 'a.pdf'), ('size', 'b.pdf')]
+    assert not reconciler.complete and reconciler.last == 'b.pdf'
+
+    reconciler, found = issues(conn, folder, start_after='b.pdf')
+    assert found == [('orphan', 'c.pdf'), ('orphan', 'd.pdf'), ('missing', 'e.pdf')]
+    assert reconciler.complete
+
+
+def test_missing_rows_guard(conn, folder):
+    for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+        add_resource(conn, name)
+    add_file(folder, 'a.pdf')
+
+    # Two of three files gone looks like the wrong folder, not lost uploads
+    reconciler, found = issues(conn, folder)
+    assert len(found) == 2 and reconciler.too_many_missing(len(found))
+    add_file(folder, 'b.pdf')
+    reconciler, found = issues(conn, folder)
+    assert not reconciler.too_many_missing(len(found))
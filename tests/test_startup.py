@@ -0,0 +1,54 @@
+"""Cold-start checks for the app factory (what a gunicorn worker does on boot).
+
+Each boot runs in a fresh interpreter, so imports are not cached, from an
+empty working directory, so anything startup creates shows up. The budget
+can be raised on slow machines:
+
+    STARTUP_BUDGET=2.5 python -m pytest tests/test_startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET', '1.0'))
+RUNS = int(os.environ.get('STARTUP_RUNS', '5'))
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Files and folders only `flask --app app init-db` may create
+STORAGE = ('users.db', 'history', 'previews', 'uploads')
+
+MEASURE = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - start)
+"""
+
+
+@pytest.fixture(scope='module')
+def boots(tmp_path_factory):
+    """Boot the app RUNS times; returns (timings, working directory)"""
+    workdir = tmp_path_factory.mktemp('startup')
+    timings = []
+    for _ in range(RUNS):
+        result = subprocess.run([sys.executable, '-c', MEASURE, APP_DIR], capture_output=True, text=True,
+                                cwd=workdir)
+        assert result.returncode == 0, result.stderr
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings, workdir
+
+
+def test_startup_creates_no_storage(boots):
+    # The factory must not touch the database or create folders
+    created = sorted(name for name in os.listdir(boots[1]) if name in STORAGE)
+    assert created == [], f"startup created {', '.join(created)}; that belongs in init-db"
+
+
+def test_startup_is_within_budget(boots):
+    median = statistics.median(boots[0])
+    assert median <= BUDGET_SECONDS, f'median cold start {median * 1000:.1f} ms, budget {BUDGET_SECONDS * 1000:.0f} ms'
@@ -0,0 +1,5 @@
+# WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# Run `flask --app app init-db` once per deploy before starting workers.
+from app import create_app
+
+app = create_app()